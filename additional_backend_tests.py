@@ -4,19 +4,22 @@ Additional Backend API Tests for Edge Cases
 """
 
 import requests
+import functools
 import json
 import os
 import io
 from PIL import Image
 import tempfile
 
-# Get backend URL from frontend .env file
+# Get backend URL from frontend .env file (parsed once per process)
+@functools.lru_cache(maxsize=1)
 def get_backend_url():
     try:
         with open('/app/frontend/.env', 'r') as f:
             for line in f:
-                if line.startswith('REACT_APP_BACKEND_URL='):
-                    return line.split('=', 1)[1].strip()
+                key, sep, value = line.partition('=')
+                if sep and key == 'REACT_APP_BACKEND_URL':
+                    return value.strip()
     except:
         pass
     return "http://localhost:8001"
@@ -24,23 +27,34 @@ def get_backend_url():
 BASE_URL = get_backend_url()
 API_BASE = f"{BASE_URL}/api"
 
+# Shared session so every test reuses the same keep-alive connection
+SESSION = requests.Session()
+
 print(f"Testing additional edge cases at: {API_BASE}")
 
+def _encode_image(size, color, format='JPEG', **options):
+    """Encode a solid-color image once and return its raw bytes"""
+    img = Image.new('RGB', size, color)
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format=format, **options)
+    return img_bytes.getvalue()
+
+# Fixture images are encoded once at import and wrapped in a fresh BytesIO per request
+LARGE_JPEG_BYTES = _encode_image((3000, 3000), (255, 0, 0), quality=85, optimize=False, progressive=False)
+PNG_BYTES = _encode_image((100, 100), (0, 255, 0), format='PNG')
+RED_JPEG_BYTES = _encode_image((100, 100), (255, 0, 0))
+THRESHOLD_JPEG_BYTES = _encode_image((100, 100), (128, 128, 128))
+THRESHOLD_SCAN_JPEG_BYTES = _encode_image((100, 100), (130, 130, 130))  # Slightly different
+UPDATE_JPEG_BYTES = _encode_image((100, 100), (200, 100, 50))
+BULK_JPEG_BYTES = [_encode_image((100, 100), color) for color in [(10, 20, 30), (40, 50, 60), (70, 80, 90)]]
+
 def create_large_image():
     """Create a large image to test file size limits"""
-    img = Image.new('RGB', (3000, 3000), (255, 0, 0))
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='JPEG', quality=95)
-    img_bytes.seek(0)
-    return img_bytes
+    return io.BytesIO(LARGE_JPEG_BYTES)
 
 def create_png_image():
     """Create a PNG image to test different formats"""
-    img = Image.new('RGB', (100, 100), (0, 255, 0))
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
-    return img_bytes
+    return io.BytesIO(PNG_BYTES)
 
 def test_png_upload():
     """Test uploading PNG image"""
@@ -55,7 +69,7 @@ def test_png_upload():
     }
     
     try:
-        response = requests.post(f"{API_BASE}/link-image", files=files, data=data)
+        response = SESSION.post(f"{API_BASE}/link-image", files=files, data=data)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
@@ -82,7 +96,7 @@ def test_large_image_upload():
     }
     
     try:
-        response = requests.post(f"{API_BASE}/link-image", files=files, data=data)
+        response = SESSION.post(f"{API_BASE}/link-image", files=files, data=data)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
@@ -103,18 +117,13 @@ def test_missing_url_parameter():
     """Test uploading image without URL parameter"""
     print("\n=== Testing Missing URL Parameter ===")
     
-    test_image = Image.new('RGB', (100, 100), (255, 0, 0))
-    img_bytes = io.BytesIO()
-    test_image.save(img_bytes, format='JPEG')
-    img_bytes.seek(0)
-    
     files = {
-        'file': ('test.jpg', img_bytes, 'image/jpeg')
+        'file': ('test.jpg', io.BytesIO(RED_JPEG_BYTES), 'image/jpeg')
     }
     # No URL parameter provided
     
     try:
-        response = requests.post(f"{API_BASE}/link-image", files=files)
+        response = SESSION.post(f"{API_BASE}/link-image", files=files)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
@@ -138,7 +147,7 @@ def test_missing_file_parameter():
     # No file parameter provided
     
     try:
-        response = requests.post(f"{API_BASE}/link-image", data=data)
+        response = SESSION.post(f"{API_BASE}/link-image", data=data)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
@@ -157,38 +166,28 @@ def test_scan_with_custom_threshold():
     print("\n=== Testing Scan with Custom Threshold ===")
     
     # First link an image
-    test_image = Image.new('RGB', (100, 100), (128, 128, 128))
-    img_bytes = io.BytesIO()
-    test_image.save(img_bytes, format='JPEG')
-    img_bytes.seek(0)
-    
     files = {
-        'file': ('threshold_test.jpg', img_bytes, 'image/jpeg')
+        'file': ('threshold_test.jpg', io.BytesIO(THRESHOLD_JPEG_BYTES), 'image/jpeg')
     }
     data = {
         'url': 'https://example.com/threshold-test'
     }
     
-    link_response = requests.post(f"{API_BASE}/link-image", files=files, data=data)
+    link_response = SESSION.post(f"{API_BASE}/link-image", files=files, data=data)
     if link_response.status_code != 200:
         print("❌ Failed to link image for threshold test")
         return False
     
     # Now scan with very strict threshold
-    similar_image = Image.new('RGB', (100, 100), (130, 130, 130))  # Slightly different
-    scan_bytes = io.BytesIO()
-    similar_image.save(scan_bytes, format='JPEG')
-    scan_bytes.seek(0)
-    
     scan_files = {
-        'file': ('scan_threshold.jpg', scan_bytes, 'image/jpeg')
+        'file': ('scan_threshold.jpg', io.BytesIO(THRESHOLD_SCAN_JPEG_BYTES), 'image/jpeg')
     }
     scan_data = {
         'threshold': '1'  # Very strict threshold
     }
     
     try:
-        response = requests.post(f"{API_BASE}/scan-image", files=scan_files, data=scan_data)
+        response = SESSION.post(f"{API_BASE}/scan-image", files=scan_files, data=scan_data)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
@@ -207,21 +206,15 @@ def test_update_existing_image_url():
     """Test updating URL for an existing image"""
     print("\n=== Testing Update Existing Image URL ===")
     
-    # Create a unique image
-    test_image = Image.new('RGB', (100, 100), (200, 100, 50))
-    img_bytes = io.BytesIO()
-    test_image.save(img_bytes, format='JPEG')
-    img_bytes.seek(0)
-    
     # First upload
     files = {
-        'file': ('update_test.jpg', img_bytes, 'image/jpeg')
+        'file': ('update_test.jpg', io.BytesIO(UPDATE_JPEG_BYTES), 'image/jpeg')
     }
     data = {
         'url': 'https://example.com/original-url'
     }
     
-    first_response = requests.post(f"{API_BASE}/link-image", files=files, data=data)
+    first_response = SESSION.post(f"{API_BASE}/link-image", files=files, data=data)
     if first_response.status_code != 200:
         print("❌ Failed to link image for update test")
         return False
@@ -230,16 +223,15 @@ def test_update_existing_image_url():
     original_id = first_result.get('image_id')
     
     # Upload same image with different URL
-    img_bytes.seek(0)  # Reset stream
     files = {
-        'file': ('update_test.jpg', img_bytes, 'image/jpeg')
+        'file': ('update_test.jpg', io.BytesIO(UPDATE_JPEG_BYTES), 'image/jpeg')
     }
     data = {
         'url': 'https://example.com/updated-url'
     }
     
     try:
-        response = requests.post(f"{API_BASE}/link-image", files=files, data=data)
+        response = SESSION.post(f"{API_BASE}/link-image", files=files, data=data)
         print(f"Status Code: {response.status_code}")
         print(f"Response: {response.json()}")
         
@@ -258,6 +250,36 @@ def test_update_existing_image_url():
         print(f"❌ Update existing image URL test failed with exception: {e}")
         return False
 
+def test_bulk_link_images():
+    """Test linking several images in one request"""
+    print("\n=== Testing Bulk Link Images ===")
+    
+    files = []
+    data = {'urls': []}
+    for index, image_bytes in enumerate(BULK_JPEG_BYTES):
+        files.append(('files', (f'bulk_{index}.jpg', io.BytesIO(image_bytes), 'image/jpeg')))
+        data['urls'].append(f'https://example.com/bulk-{index}')
+    
+    try:
+        response = SESSION.post(f"{API_BASE}/link-images-bulk", files=files, data=data)
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.json()}")
+        
+        if response.status_code == 200:
+            result = response.json()
+            if len(result.get('results', [])) == len(BULK_JPEG_BYTES) and all(item.get('image_id') for item in result['results']):
+                print("✅ Bulk link images test passed")
+                return True
+            else:
+                print("❌ Bulk link images test failed - Unexpected response")
+                return False
+        else:
+            print(f"❌ Bulk link images test failed - Status: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ Bulk link images test failed with exception: {e}")
+        return False
+
 def run_additional_tests():
     """Run all additional edge case tests"""
     print("🔍 Starting Additional Backend Edge Case Tests")
@@ -281,6 +303,9 @@ def run_additional_tests():
     # Test URL update
     test_results['update_url'] = test_update_existing_image_url()
     
+    # Test bulk linking
+    test_results['bulk_link'] = test_bulk_link_images()
+    
     # Summary
     print("\n" + "=" * 60)
     print("📊 ADDITIONAL TESTS SUMMARY")
@@ -300,4 +325,7 @@ def run_additional_tests():
     return test_results
 
 if __name__ == "__main__":
-    run_additional_tests()
\ No newline at end of file
+    try:
+        run_additional_tests()
+    finally:
+        SESSION.close()
\ No newline at end of file
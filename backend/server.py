@@ -1,21 +1,31 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Form, Query
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, RedirectResponse
 from dotenv import load_dotenv
+from starlette.datastructures import Headers
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import BinaryIO, List, Optional, Union
 import uuid
+import asyncio
 from datetime import datetime
 import hashlib
-import io
+import ssl
 from PIL import Image
 import imagehash
+import numpy as np
 import magic
 
+try:
+    import faiss
+except ImportError:  # optional; scans fall back to the NumPy popcount path
+    faiss = None
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
@@ -24,33 +34,117 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ['DB_NAME']]
 
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
 # Create the main app without a prefix
-app = FastAPI(title="Image-to-URL Recognition App")
+app = FastAPI(title="Image-to-URL Recognition App", default_response_class=ORJSONResponse)
+
+# Largest batch accepted by /api/link-images-bulk
+MAX_BULK_FILES = 20
+
+# Upload endpoints with the number of files each accepts, and the multipart framing allowed per file
+UPLOAD_PATHS = {"/api/link-image": 1, "/api/scan-image": 1, "/api/link-images-bulk": MAX_BULK_FILES}
+MULTIPART_OVERHEAD = 64 * 1024
+
+class UploadSizeLimit:
+    """Cap upload bodies before FastAPI spools them, whether or not the client sends Content-Length."""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        max_files = UPLOAD_PATHS[scope["path"]]
+        limit = max_files * (image_processor.max_file_size + MULTIPART_OVERHEAD)
+        detail = "File too large (max 10MB)" if max_files == 1 else f"Upload too large (max {max_files} files of 10MB)"
+        
+        # Reject a declared oversized body without reading any of it
+        try:
+            content_length = int(Headers(scope=scope).get("content-length", "0"))
+        except ValueError:
+            content_length = 0
+        if content_length > limit:
+            response = JSONResponse(status_code=413, content={"detail": detail})
+            await response(scope, receive, send)
+            return
+        
+        # Count what actually arrives, so chunked or mislabelled bodies stop at the same cap
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+# Added before CORS so CORS stays outermost and 413 responses still carry its headers
+app.add_middleware(UploadSizeLimit)
+
+ALLOWED_ORIGINS = [origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',')]
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_credentials=True,
+    allow_origins=ALLOWED_ORIGINS,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# libmagic database is loaded once; Magic.from_buffer serialises calls with its own lock
+MAGIC_MIME = magic.Magic(mime=True)
+
 # Image Processing Class
 class ImageProcessor:
     def __init__(self):
         self.supported_formats = {'JPEG', 'PNG', 'GIF', 'BMP', 'WEBP'}
         self.max_dimension = 2048
         self.hash_size = 8
+        self.hash_input_size = 64  # covers phash's 32x32 input at hash_size 8
         self.max_file_size = 10 * 1024 * 1024  # 10MB
-        self.allowed_mime_types = {'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/webp'}
+        self.magic_prefix_size = 4096  # libmagic only inspects the first few hundred bytes
+        # Older libmagic releases report BMP files as image/x-ms-bmp
+        self.allowed_mime_types = {'image/jpeg', 'image/png', 'image/gif', 'image/bmp', 'image/x-ms-bmp', 'image/webp'}
+        # whash runs a wavelet transform per image, so it is opt-in via IMAGE_HASHES
+        self.enabled_hashes = {
+            name.strip() for name in os.environ.get('IMAGE_HASHES', 'ahash,phash,dhash').split(',') if name.strip()
+        }
     
     async def validate_and_process_image(self, file: UploadFile) -> dict:
         """Validate and process uploaded image."""
-        # Read file content
-        content = await file.read()
-        
-        # Validate file size
-        if len(content) > self.max_file_size:
+        # UploadSizeLimit capped the request body and Starlette has spooled the upload;
+        # check this file's own size without reading it again
+        file_size = file.size
+        if file_size is None:
+            file_size = file.file.seek(0, os.SEEK_END)
+        if file_size > self.max_file_size:
             raise HTTPException(status_code=413, detail="File too large (max 10MB)")
+        file.file.seek(0)
         
-        # Validate MIME type using python-magic
+        # Decoding and hashing are CPU-bound, so keep them off the event loop
+        return await asyncio.to_thread(self.process_upload, file.file, file_size)
+    
+    def process_upload(self, spool: BinaryIO, file_size: int) -> dict:
+        """Validate, decode and hash a fully received upload."""
+        # Validate MIME type using python-magic, which only needs the start of the file
         try:
-            detected_type = magic.from_buffer(content, mime=True)
+            detected_type = MAGIC_MIME.from_buffer(spool.read(self.magic_prefix_size))
+            spool.seek(0)
             if detected_type not in self.allowed_mime_types:
                 raise HTTPException(status_code=400, detail=f"Unsupported file type: {detected_type}")
         except Exception:
@@ -58,7 +152,11 @@ class ImageProcessor:
         
         # Load and validate image
         try:
-            image = Image.open(io.BytesIO(content))
+            image = Image.open(spool)
+            
+            # Let libjpeg decode large JPEGs at a reduced scale close to the target size
+            if image.format == 'JPEG':
+                image.draft('RGB', (self.max_dimension, self.max_dimension))
             
             # Convert to RGB if necessary
             if image.mode != 'RGB':
@@ -66,20 +164,23 @@ class ImageProcessor:
             
             # Resize if image is too large
             if max(image.size) > self.max_dimension:
-                image.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
+                image.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.BILINEAR)
             
-            # Compute perceptual hashes
+            # Compute perceptual hashes, plus integer copies so stored hashes never need hex parsing
             hashes = self.compute_hashes(image)
+            hash_ints = {f'{name}_int': self.hash_to_int(value) for name, value in hashes.items()}
             
             # Generate file hash for deduplication
-            file_hash = hashlib.sha256(content).hexdigest()
+            spool.seek(0)
+            file_hash = hashlib.file_digest(spool, 'sha256').hexdigest()
             
             return {
                 'image': image,
                 'hashes': hashes,
+                'hash_ints': hash_ints,
                 'file_hash': file_hash,
                 'content_type': detected_type,
-                'file_size': len(content),
+                'file_size': file_size,
                 'image_size': image.size
             }
             
@@ -90,46 +191,263 @@ class ImageProcessor:
         """Compute multiple perceptual hashes for comprehensive comparison."""
         hashes = {}
         
+        # Downscale once; every hasher works on a small grayscale image anyway
+        image = image.convert('L').resize((self.hash_input_size, self.hash_input_size), Image.Resampling.BILINEAR)
+        
         # Average hash - fast but less accurate
-        hashes['ahash'] = str(imagehash.average_hash(image, hash_size=self.hash_size))
+        if 'ahash' in self.enabled_hashes:
+            hashes['ahash'] = str(imagehash.average_hash(image, hash_size=self.hash_size))
         
         # Perceptual hash - more accurate but slower
-        hashes['phash'] = str(imagehash.phash(image, hash_size=self.hash_size))
+        if 'phash' in self.enabled_hashes:
+            hashes['phash'] = str(imagehash.phash(image, hash_size=self.hash_size))
         
         # Difference hash - good balance of speed and accuracy
-        hashes['dhash'] = str(imagehash.dhash(image, hash_size=self.hash_size))
+        if 'dhash' in self.enabled_hashes:
+            hashes['dhash'] = str(imagehash.dhash(image, hash_size=self.hash_size))
         
-        # Wavelet hash - good for scaled images
-        hashes['whash'] = str(imagehash.whash(image, hash_size=self.hash_size))
+        # Wavelet hash - good for scaled images, but the slowest of the four
+        if 'whash' in self.enabled_hashes:
+            hashes['whash'] = self._whash_fast(image)
         
         return hashes
     
-    def calculate_similarity(self, hash1: str, hash2: str) -> int:
-        """Calculate Hamming distance between two hashes."""
-        if len(hash1) != len(hash2):
-            return 64  # Maximum distance if lengths don't match
-        
-        # Convert hex strings to binary and calculate differences
-        try:
-            bin1 = bin(int(hash1, 16))[2:].zfill(len(hash1) * 4)
-            bin2 = bin(int(hash2, 16))[2:].zfill(len(hash2) * 4)
-            return sum(b1 != b2 for b1, b2 in zip(bin1, bin2))
-        except ValueError:
-            return 64  # Maximum distance if conversion fails
+    def _whash_fast(self, image: Image.Image) -> str:
+        """Haar wavelet hash of the square grayscale hash input, equivalent to imagehash.whash up to ties at the median."""
+        # The Haar LL band after log2(block) levels is each block's mean (up to scale), and
+        # removing the top-level LL only shifts every coefficient, so the median split is unchanged
+        pixels = np.asarray(image, dtype=np.float64)
+        block = pixels.shape[0] // self.hash_size
+        ll = pixels.reshape(self.hash_size, block, self.hash_size, block).mean(axis=(1, 3))
+        return np.packbits(ll > np.median(ll)).tobytes().hex()
+    
+    @staticmethod
+    def hash_to_int(hex_hash: str) -> int:
+        """Convert a 64-bit hex hash to the signed int64 MongoDB stores as a NumberLong."""
+        value = int(hex_hash, 16)
+        return value - (1 << 64) if value >= (1 << 63) else value
 
 # Global image processor instance
 image_processor = ImageProcessor()
 
+# In-memory hash index
+class HashIndex:
+    """Columnar copy of the stored hashes so scans run as one vectorised XOR + popcount per algorithm.
+    
+    When faiss is installed, searches go through one IndexBinaryFlat per algorithm instead,
+    rebuilt lazily from the columns after the index changes.
+    """
+    algorithms = ('dhash', 'phash', 'ahash', 'whash')
+    # Fields kept per image so a scan can answer without going back to MongoDB
+    record_fields = ('id', 'filename', 'url', 'created_at', 'file_hash')
+    # Larger than any 64-bit Hamming distance; marks hashes missing on a stored image
+    missing_distance = 255
+    
+    def __init__(self):
+        self.ids: List[str] = []
+        self.records: List[dict] = []
+        self.by_file_hash: dict = {}
+        self.columns = {algorithm: np.empty(0, dtype=np.uint64) for algorithm in self.algorithms}
+        self.present = {algorithm: np.empty(0, dtype=bool) for algorithm in self.algorithms}
+        self._faiss_indexes: Optional[dict] = None
+        # False until a full read from MongoDB succeeds; scans must not trust a partial index
+        self.loaded = False
+        # Bumped on every incremental change so a reload can tell it raced with one
+        self.version = 0
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    @staticmethod
+    def _to_uint64(value: Union[str, int, None]) -> int:
+        try:
+            if isinstance(value, str):
+                value = int(value, 16)
+            return value & 0xFFFFFFFFFFFFFFFF
+        except (TypeError, ValueError):
+            return 0
+    
+    @staticmethod
+    def _stored_hash(doc: dict, algorithm: str) -> Union[str, int, None]:
+        # Prefer the integer column; records linked before it existed only have hex
+        value = doc.get(f'{algorithm}_int')
+        return value if value is not None else doc.get(algorithm)
+    
+    @classmethod
+    def _record(cls, doc: dict) -> dict:
+        record = {field: doc.get(field) for field in cls.record_fields}
+        # MongoDB keeps milliseconds, so cache what /stored-images will read back
+        created_at = record['created_at']
+        if isinstance(created_at, datetime):
+            record['created_at'] = created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
+        return record
+    
+    def _column_values(self, docs: List[dict], algorithm: str):
+        values = np.fromiter((self._to_uint64(self._stored_hash(doc, algorithm)) for doc in docs), dtype=np.uint64, count=len(docs))
+        present = np.fromiter((bool(doc.get(algorithm)) for doc in docs), dtype=bool, count=len(docs))
+        return values, present
+    
+    def load(self, docs: List[dict]):
+        """Replace the index contents with the given stored documents."""
+        self.ids = [doc['id'] for doc in docs]
+        self.records = [self._record(doc) for doc in docs]
+        self.by_file_hash = {record['file_hash']: record for record in self.records if record['file_hash']}
+        for algorithm in self.algorithms:
+            self.columns[algorithm], self.present[algorithm] = self._column_values(docs, algorithm)
+        self._faiss_indexes = None
+        self.loaded = True
+    
+    def add(self, doc: dict):
+        """Append a newly stored document to the index."""
+        self.ids.append(doc['id'])
+        record = self._record(doc)
+        self.records.append(record)
+        if record['file_hash']:
+            self.by_file_hash[record['file_hash']] = record
+        for algorithm in self.algorithms:
+            values, present = self._column_values([doc], algorithm)
+            self.columns[algorithm] = np.concatenate((self.columns[algorithm], values))
+            self.present[algorithm] = np.concatenate((self.present[algorithm], present))
+        self._faiss_indexes = None
+        self.version += 1
+    
+    def update_url(self, image_id: str, url: str):
+        """Point an indexed image at a new URL."""
+        self.version += 1
+        try:
+            self.records[self.ids.index(image_id)]['url'] = url
+        except ValueError:
+            pass
+    
+    def remove(self, image_id: str):
+        """Drop a deleted document from the index."""
+        self.version += 1
+        try:
+            position = self.ids.index(image_id)
+        except ValueError:
+            return
+        del self.ids[position]
+        record = self.records.pop(position)
+        self.by_file_hash.pop(record['file_hash'], None)
+        for algorithm in self.algorithms:
+            self.columns[algorithm] = np.delete(self.columns[algorithm], position)
+            self.present[algorithm] = np.delete(self.present[algorithm], position)
+        self._faiss_indexes = None
+    
+    def find_exact(self, file_hash: str) -> Optional[dict]:
+        """Return a byte-identical stored image in the same shape as search(), or None."""
+        record = self.by_file_hash.get(file_hash)
+        if record is None:
+            return None
+        return {'image': record, 'distance': 0, 'algorithm': 'file_hash'}
+    
+    @staticmethod
+    def _popcount(values: np.ndarray) -> np.ndarray:
+        if hasattr(np, 'bitwise_count'):
+            return np.bitwise_count(values)
+        return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+    
+    def search(self, query_hashes: dict) -> Optional[dict]:
+        """Return the closest stored image as {'image', 'distance', 'algorithm'}, or None if nothing is comparable."""
+        if not self.ids:
+            return None
+        
+        algorithms = [algorithm for algorithm in self.algorithms if query_hashes.get(algorithm)]
+        if not algorithms:
+            return None
+        
+        if faiss is not None:
+            return self._search_faiss(query_hashes, algorithms)
+        
+        # One row of distances per algorithm, with missing stored hashes pushed out of reach
+        distances = np.empty((len(algorithms), len(self.ids)), dtype=np.uint16)
+        for row, algorithm in enumerate(algorithms):
+            query = np.uint64(self._to_uint64(query_hashes[algorithm]))
+            distances[row] = self._popcount(self.columns[algorithm] ^ query)
+            distances[row][~self.present[algorithm]] = self.missing_distance
+            
+            # Nothing beats a zero distance, so skip the remaining algorithms
+            position = int(distances[row].argmin())
+            if distances[row][position] == 0:
+                return {'image': self.records[position], 'distance': 0, 'algorithm': algorithm}
+        
+        # Minimum over algorithms per image, then the first closest image
+        best_algorithms = distances.argmin(axis=0)
+        min_distances = distances[best_algorithms, np.arange(len(self.ids))]
+        best = int(min_distances.argmin())
+        if min_distances[best] >= self.missing_distance:
+            return None
+        
+        return {
+            'image': self.records[best],
+            'distance': int(min_distances[best]),
+            'algorithm': algorithms[int(best_algorithms[best])]
+        }
+
+    def _build_faiss_indexes(self) -> dict:
+        # Only images that have a given hash go into that algorithm's index
+        indexes = {}
+        for algorithm in self.algorithms:
+            positions = np.flatnonzero(self.present[algorithm])
+            index = faiss.IndexBinaryFlat(64)
+            if positions.size:
+                index.add(self.columns[algorithm][positions].view(np.uint8).reshape(-1, 8))
+            indexes[algorithm] = (index, positions)
+        return indexes
+    
+    def _search_faiss(self, query_hashes: dict, algorithms: List[str]) -> Optional[dict]:
+        if self._faiss_indexes is None:
+            self._faiss_indexes = self._build_faiss_indexes()
+        
+        # The best image over all algorithms is the best of each algorithm's nearest neighbour
+        best = None
+        for algorithm in algorithms:
+            index, positions = self._faiss_indexes[algorithm]
+            if index.ntotal == 0:
+                continue
+            query = np.array([self._to_uint64(query_hashes[algorithm])], dtype=np.uint64).view(np.uint8).reshape(1, 8)
+            distances, rows = index.search(query, 1)
+            candidate = (int(distances[0, 0]), int(positions[rows[0, 0]]), algorithm)
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+            if candidate[0] == 0:
+                break
+        
+        if best is None:
+            return None
+        return {'image': self.records[best[1]], 'distance': best[0], 'algorithm': best[2]}
+
+# Global hash index instance, loaded from MongoDB on startup
+hash_index = HashIndex()
+hash_index_lock = asyncio.Lock()
+
+async def ensure_hash_index_loaded():
+    """Load every stored image into the hash index unless a previous load already succeeded."""
+    fields = HashIndex.record_fields + HashIndex.algorithms + tuple(f'{algorithm}_int' for algorithm in HashIndex.algorithms)
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    async with hash_index_lock:
+        while not hash_index.loaded:
+            # Links or deletes that land mid-read may be missing from the snapshot, so read again
+            version = hash_index.version
+            docs = [doc async for doc in db.image_links.find({}, projection)]
+            if hash_index.version == version:
+                hash_index.load(docs)
+                logger.info(f"Loaded {len(hash_index)} stored images into the hash index")
+
 # Pydantic Models
 class ImageLink(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     filename: str
     url: str
     file_hash: str
-    ahash: str
-    phash: str
-    dhash: str
-    whash: str
+    ahash: Optional[str] = None
+    phash: Optional[str] = None
+    dhash: Optional[str] = None
+    whash: Optional[str] = None
+    ahash_int: Optional[int] = None
+    phash_int: Optional[int] = None
+    dhash_int: Optional[int] = None
+    whash_int: Optional[int] = None
     content_type: str
     file_size: int
     image_width: int
@@ -156,13 +474,14 @@ async def link_image_to_url(
         result = await image_processor.validate_and_process_image(file)
         
         # Check if this exact image already exists
-        existing = await db.image_links.find_one({"file_hash": result['file_hash']})
+        existing = await db.image_links.find_one({"file_hash": result['file_hash']}, {"_id": 0, "id": 1})
         if existing:
             # Update the URL for existing image
             await db.image_links.update_one(
                 {"file_hash": result['file_hash']},
                 {"$set": {"url": url, "updated_at": datetime.utcnow()}}
             )
+            hash_index.update_url(existing['id'], url)
             return {
                 "status": "updated",
                 "message": f"Updated URL for existing image: {file.filename}",
@@ -175,10 +494,8 @@ async def link_image_to_url(
             filename=file.filename or "unknown",
             url=url,
             file_hash=result['file_hash'],
-            ahash=result['hashes']['ahash'],
-            phash=result['hashes']['phash'],
-            dhash=result['hashes']['dhash'],
-            whash=result['hashes']['whash'],
+            **result['hashes'],
+            **result['hash_ints'],
             content_type=result['content_type'],
             file_size=result['file_size'],
             image_width=result['image_size'][0],
@@ -186,7 +503,24 @@ async def link_image_to_url(
         )
         
         # Store in database
-        await db.image_links.insert_one(image_link.dict())
+        document = image_link.model_dump()
+        try:
+            await db.image_links.insert_one(document)
+        except DuplicateKeyError:
+            # A concurrent upload of the same file won the insert; update it instead
+            existing = await db.image_links.find_one_and_update(
+                {"file_hash": result['file_hash']},
+                {"$set": {"url": url, "updated_at": datetime.utcnow()}},
+                projection={"_id": 0, "id": 1}
+            )
+            hash_index.update_url(existing['id'], url)
+            return {
+                "status": "updated",
+                "message": f"Updated URL for existing image: {file.filename}",
+                "image_id": existing['id'],
+                "url": url
+            }
+        hash_index.add(document)
         
         return {
             "status": "created",
@@ -202,6 +536,125 @@ async def link_image_to_url(
         logger.error(f"Error linking image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@api_router.post("/link-images-bulk", response_model=dict)
+async def link_images_bulk(
+    urls: List[str] = Form(...),
+    files: List[UploadFile] = File(...)
+):
+    """Link several uploaded images to URLs in a single request."""
+    try:
+        if len(files) > MAX_BULK_FILES:
+            raise HTTPException(status_code=413, detail=f"Too many files (max {MAX_BULK_FILES} per request)")
+        if len(urls) != len(files):
+            raise HTTPException(status_code=400, detail="Provide exactly one url per file")
+        
+        # Process every image before touching the database
+        processed = [await image_processor.validate_and_process_image(file) for file in files]
+        
+        # Find all already-linked images with one query
+        cursor = db.image_links.find(
+            {"file_hash": {"$in": [result['file_hash'] for result in processed]}},
+            {"_id": 0, "id": 1, "file_hash": 1}
+        )
+        existing = {doc['file_hash']: doc['id'] async for doc in cursor}
+        
+        results = []
+        updates = {}
+        new_links = {}
+        for file, url, result in zip(files, urls, processed):
+            file_hash = result['file_hash']
+            if file_hash in existing:
+                # Update the URL for existing image
+                updates[file_hash] = url
+                results.append({"status": "updated", "filename": file.filename, "image_id": existing[file_hash], "url": url})
+            elif file_hash in new_links:
+                # Same file twice in one batch; the last URL wins
+                new_links[file_hash].url = url
+                results.append({"status": "updated", "filename": file.filename, "image_id": new_links[file_hash].id, "url": url})
+            else:
+                image_link = ImageLink(
+                    filename=file.filename or "unknown",
+                    url=url,
+                    file_hash=file_hash,
+                    **result['hashes'],
+                    **result['hash_ints'],
+                    content_type=result['content_type'],
+                    file_size=result['file_size'],
+                    image_width=result['image_size'][0],
+                    image_height=result['image_size'][1]
+                )
+                new_links[file_hash] = image_link
+                results.append({"status": "created", "filename": file.filename, "image_id": image_link.id, "url": url})
+        
+        # Store in database with one round trip per operation type
+        if updates:
+            now = datetime.utcnow()
+            await db.image_links.bulk_write(
+                [UpdateOne({"file_hash": file_hash}, {"$set": {"url": url, "updated_at": now}}) for file_hash, url in updates.items()],
+                ordered=False
+            )
+            for file_hash, url in updates.items():
+                hash_index.update_url(existing[file_hash], url)
+        
+        documents = [image_link.model_dump() for image_link in new_links.values()]
+        failed_ids = set()
+        lost = []
+        write_error = None
+        if documents:
+            try:
+                await db.image_links.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                write_errors = e.details['writeErrors']
+                failed_ids = {documents[error['index']]['id'] for error in write_errors}
+                lost = [documents[error['index']] for error in write_errors if error['code'] == 11000]
+                if len(lost) < len(write_errors):
+                    write_error = e
+            for document in documents:
+                if document['id'] not in failed_ids:
+                    hash_index.add(document)
+        
+        if write_error is not None:
+            raise write_error
+        
+        # Concurrent uploads of the same files won those inserts; update them instead
+        winners = {}
+        if lost:
+            now = datetime.utcnow()
+            await db.image_links.bulk_write(
+                [UpdateOne({"file_hash": doc['file_hash']}, {"$set": {"url": doc['url'], "updated_at": now}}) for doc in lost],
+                ordered=False
+            )
+            cursor = db.image_links.find(
+                {"file_hash": {"$in": [doc['file_hash'] for doc in lost]}},
+                {"_id": 0, "id": 1, "file_hash": 1}
+            )
+            winner_ids = {doc['file_hash']: doc['id'] async for doc in cursor}
+            for doc in lost:
+                if doc['file_hash'] in winner_ids:
+                    winners[doc['id']] = winner_ids[doc['file_hash']]
+                    hash_index.update_url(winner_ids[doc['file_hash']], doc['url'])
+        
+        for item in results:
+            if item['image_id'] in winners:
+                item['status'] = "updated"
+                item['image_id'] = winners[item['image_id']]
+            elif item['image_id'] in failed_ids:
+                item['status'] = "failed"
+        
+        return {
+            "status": "completed",
+            "message": f"Processed {len(results)} images",
+            "created": sum(item['status'] == "created" for item in results),
+            "updated": sum(item['status'] == "updated" for item in results),
+            "results": results
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error bulk linking images: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @api_router.post("/scan-image", response_model=dict)
 async def scan_image_for_url(
     file: UploadFile = File(...),
@@ -213,38 +666,25 @@ async def scan_image_for_url(
         result = await image_processor.validate_and_process_image(file)
         query_hashes = result['hashes']
         
-        # Search for similar images in database
-        stored_images = await db.image_links.find({}).to_list(1000)
+        # Retry the startup load if it failed, rather than scanning an incomplete index
+        await ensure_hash_index_loaded()
+        
+        # Byte-identical uploads are answered without a Hamming search
+        closest = hash_index.find_exact(result['file_hash']) or hash_index.search(query_hashes)
         
         best_match = None
-        best_distance = float('inf')
-        
-        for stored_image in stored_images:
-            # Calculate similarity using different algorithms
-            distances = {}
-            for algorithm in ['dhash', 'phash', 'ahash', 'whash']:
-                if algorithm in query_hashes and algorithm in stored_image:
-                    distance = image_processor.calculate_similarity(
-                        query_hashes[algorithm], 
-                        stored_image[algorithm]
-                    )
-                    distances[algorithm] = distance
-            
-            if distances:
-                # Use the minimum distance (best match) from all algorithms
-                min_distance = min(distances.values())
-                
-                if min_distance <= threshold and min_distance < best_distance:
-                    best_distance = min_distance
-                    best_match = {
-                        'id': stored_image['id'],
-                        'filename': stored_image['filename'],
-                        'url': stored_image['url'],
-                        'distance': min_distance,
-                        'similarity_percentage': max(0, 100 - (min_distance * 10)),
-                        'algorithm_used': min(distances, key=distances.get),
-                        'created_at': stored_image['created_at']
-                    }
+        if closest and closest['distance'] <= threshold:
+            stored_image = closest['image']
+            min_distance = closest['distance']
+            best_match = {
+                'id': stored_image['id'],
+                'filename': stored_image['filename'],
+                'url': stored_image['url'],
+                'distance': min_distance,
+                'similarity_percentage': max(0, 100 - (min_distance * 10)),
+                'algorithm_used': closest['algorithm'],
+                'created_at': stored_image['created_at']
+            }
         
         if best_match:
             return {
@@ -252,7 +692,7 @@ async def scan_image_for_url(
                 "message": f"Found matching image: {best_match['filename']}",
                 "match": best_match,
                 "redirect_url": best_match['url'],
-                "total_stored_images": len(stored_images)
+                "total_stored_images": len(hash_index)
             }
         else:
             return {
@@ -260,7 +700,7 @@ async def scan_image_for_url(
                 "message": "No matching images found",
                 "match": None,
                 "redirect_url": None,
-                "total_stored_images": len(stored_images),
+                "total_stored_images": len(hash_index),
                 "threshold_used": threshold
             }
             
@@ -270,24 +710,31 @@ async def scan_image_for_url(
         logger.error(f"Error scanning image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Fields returned for each stored image link
+STORED_IMAGE_PROJECTION = {
+    "_id": 0, "id": 1, "filename": 1, "url": 1, "content_type": 1,
+    "file_size": 1, "image_width": 1, "image_height": 1, "created_at": 1
+}
+
+def format_stored_image(img: dict) -> dict:
+    return {
+        'id': img['id'],
+        'filename': img['filename'],
+        'url': img['url'],
+        'content_type': img['content_type'],
+        'file_size': img['file_size'],
+        'image_size': f"{img['image_width']}x{img['image_height']}",
+        'created_at': img['created_at']
+    }
+
 @api_router.get("/stored-images", response_model=dict)
-async def get_stored_images():
-    """Get list of all stored image links."""
+async def get_stored_images(limit: int = Query(default=1000, ge=1, le=1000)):
+    """Get list of stored image links, up to `limit`."""
     try:
-        images = await db.image_links.find({}).to_list(1000)
-        
-        # Format response
+        # Format response while streaming from the cursor
         formatted_images = []
-        for img in images:
-            formatted_images.append({
-                'id': img['id'],
-                'filename': img['filename'],
-                'url': img['url'],
-                'content_type': img['content_type'],
-                'file_size': img['file_size'],
-                'image_size': f"{img['image_width']}x{img['image_height']}",
-                'created_at': img['created_at']
-            })
+        async for img in db.image_links.find({}, STORED_IMAGE_PROJECTION).limit(limit):
+            formatted_images.append(format_stored_image(img))
         
         return {
             "total_images": len(formatted_images),
@@ -298,6 +745,23 @@ async def get_stored_images():
         logger.error(f"Error retrieving stored images: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@api_router.get("/stored-images/{image_id}", response_model=dict)
+async def get_stored_image(image_id: str):
+    """Get a single stored image link."""
+    try:
+        img = await db.image_links.find_one({"id": image_id}, STORED_IMAGE_PROJECTION)
+        
+        if img is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        
+        return format_stored_image(img)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error retrieving stored image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
 @api_router.delete("/stored-images/{image_id}")
 async def delete_stored_image(image_id: str):
     """Delete a stored image link."""
@@ -307,6 +771,8 @@ async def delete_stored_image(image_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Image not found")
         
+        hash_index.remove(image_id)
+        
         return {"message": "Image link deleted successfully"}
         
     except HTTPException:
@@ -338,20 +804,27 @@ async def serve_main_page():
 # Include the router in the main app
 app.include_router(api_router)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@app.on_event("startup")
+async def log_hashing_backend():
+    # SHA-NI acceleration for file hashes depends on the OpenSSL build hashlib links against
+    if 'sha256' not in hashlib.algorithms_guaranteed:
+        logger.error("sha256 is not available in hashlib")
+    logger.info(f"hashlib is using {ssl.OPENSSL_VERSION}")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@app.on_event("startup")
+async def create_indexes():
+    try:
+        await db.image_links.create_index("file_hash", unique=True)
+        await db.image_links.create_index("id", unique=True)
+    except Exception as e:
+        logger.error(f"Error creating indexes: {str(e)}")
+
+@app.on_event("startup")
+async def load_hash_index():
+    try:
+        await ensure_hash_index_loaded()
+    except Exception as e:
+        logger.error(f"Error loading hash index, retrying on the next scan: {str(e)}")
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
@@ -0,0 +1,246 @@
+"""
+Unit tests for the in-memory HashIndex used by /api/scan-image
+"""
+
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'backend'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+
+import server  # noqa: E402
+from server import HashIndex, ImageProcessor  # noqa: E402
+
+
+def make_doc(image_id, **hashes):
+    """Build a stored document the way link-image inserts it"""
+    doc = {
+        'id': image_id,
+        'filename': f'{image_id}.bmp',
+        'url': f'https://example.com/{image_id}',
+        'created_at': None,
+        'file_hash': f'sha-{image_id}',
+    }
+    for algorithm, value in hashes.items():
+        doc[algorithm] = value
+        doc[f'{algorithm}_int'] = ImageProcessor.hash_to_int(value)
+    return doc
+
+
+def random_hash(rng):
+    return f'{rng.getrandbits(64):016x}'
+
+
+@pytest.fixture
+def numpy_only(monkeypatch):
+    """Force HashIndex.search onto the NumPy popcount path"""
+    monkeypatch.setattr(server, 'faiss', None)
+
+
+@pytest.mark.parametrize('hex_hash', ['8000000000000000', 'ffffffffffffffff', 'c3a5000000000001', '7fffffffffffffff', '0000000000000000'])
+def test_hash_to_int_round_trips(hex_hash):
+    value = ImageProcessor.hash_to_int(hex_hash)
+
+    assert -(1 << 63) <= value < (1 << 63)
+    assert f'{HashIndex._to_uint64(value):016x}' == hex_hash
+
+
+def test_hash_to_int_top_bit_is_negative():
+    assert ImageProcessor.hash_to_int('ffffffffffffffff') == -1
+    assert ImageProcessor.hash_to_int('8000000000000000') == -(1 << 63)
+
+
+def test_signed_and_hex_hashes_index_identically(numpy_only):
+    # Older records only carry hex; newer ones also carry the signed int
+    index = HashIndex()
+    index.load([
+        {'id': 'hex-only', 'file_hash': 'a', 'dhash': 'f0f0f0f0f0f0f0f0'},
+        make_doc('with-int', dhash='f0f0f0f0f0f0f0f0'),
+    ])
+
+    assert index.columns['dhash'][0] == index.columns['dhash'][1]
+    assert index.search({'dhash': 'f0f0f0f0f0f0f0f0'})['distance'] == 0
+
+
+@pytest.mark.parametrize('use_faiss', [False, True])
+def test_missing_hashes_never_match(monkeypatch, use_faiss):
+    if use_faiss:
+        pytest.importorskip('faiss')
+    else:
+        monkeypatch.setattr(server, 'faiss', None)
+
+    # A missing phash is stored as 0, which would otherwise be an exact match for this query
+    index = HashIndex()
+    index.load([make_doc('dhash-only', dhash='ffffffffffffff00')])
+
+    result = index.search({'phash': '0000000000000000', 'dhash': 'ffffffffffffffff'})
+
+    assert result['image']['id'] == 'dhash-only'
+    assert result['algorithm'] == 'dhash'
+    assert result['distance'] == 8
+    assert index.search({'phash': '0000000000000000'}) is None
+
+
+def test_search_exits_early_on_exact_match(numpy_only):
+    index = HashIndex()
+    index.load([make_doc('a', dhash='00000000000000ff', phash='0f0f0f0f0f0f0f0f')])
+
+    result = index.search({'dhash': '00000000000000ff', 'phash': 'f0f0f0f0f0f0f0f0'})
+
+    assert result == {'image': index.records[0], 'distance': 0, 'algorithm': 'dhash'}
+
+
+def test_add_remove_and_update_url_stay_consistent(numpy_only):
+    index = HashIndex()
+    index.load([make_doc('a', dhash='0000000000000000')])
+    index.add(make_doc('b', dhash='00000000ffffffff'))
+    index.add(make_doc('c', dhash='ffffffffffffffff'))
+
+    index.remove('b')
+    index.remove('missing')
+
+    assert index.ids == ['a', 'c']
+    assert [record['id'] for record in index.records] == ['a', 'c']
+    assert set(index.by_file_hash) == {'sha-a', 'sha-c'}
+    assert all(len(index.columns[algorithm]) == len(index) for algorithm in HashIndex.algorithms)
+    assert all(len(index.present[algorithm]) == len(index) for algorithm in HashIndex.algorithms)
+    assert index.find_exact('sha-b') is None
+    assert index.search({'dhash': '00000000ffffffff'})['distance'] == 32
+
+    index.update_url('c', 'https://example.com/moved')
+    index.update_url('missing', 'https://example.com/ignored')
+
+    assert index.search({'dhash': 'ffffffffffffffff'})['image']['url'] == 'https://example.com/moved'
+    assert index.find_exact('sha-c')['image']['url'] == 'https://example.com/moved'
+
+
+def test_empty_index_returns_none(numpy_only):
+    index = HashIndex()
+
+    assert index.search({'dhash': '0000000000000000'}) is None
+    assert index.find_exact('anything') is None
+
+
+def test_faiss_matches_numpy(monkeypatch):
+    pytest.importorskip('faiss')
+    rng = random.Random(1234)
+
+    docs = []
+    for position in range(200):
+        # Leave some hashes out so both backends also exercise the missing-hash masks
+        hashes = {algorithm: random_hash(rng) for algorithm in ('dhash', 'phash', 'ahash') if rng.random() > 0.2}
+        docs.append(make_doc(f'img-{position}', **hashes))
+    index = HashIndex()
+    index.load(docs)
+
+    queries = [{algorithm: random_hash(rng) for algorithm in ('dhash', 'phash', 'ahash')} for _ in range(50)]
+    exact = next(doc for doc in docs if 'dhash' in doc)
+    queries.append({'dhash': exact['dhash'], 'phash': random_hash(rng)})
+
+    with_faiss = [index.search(query) for query in queries]
+    monkeypatch.setattr(server, 'faiss', None)
+    with_numpy = [index.search(query) for query in queries]
+
+    for query, faiss_result, numpy_result in zip(queries, with_faiss, with_numpy):
+        assert faiss_result['distance'] == numpy_result['distance']
+        # Ties may pick different images, but each pick must really be at that distance
+        for result in (faiss_result, numpy_result):
+            position = index.ids.index(result['image']['id'])
+            stored = index.columns[result['algorithm']][position]
+            assert index.present[result['algorithm']][position]
+            assert (int(stored) ^ int(query[result['algorithm']], 16)).bit_count() == result['distance']
+
+
+def test_faiss_indexes_rebuild_after_changes():
+    pytest.importorskip('faiss')
+    index = HashIndex()
+    index.load([make_doc('a', dhash='0000000000000000')])
+    assert index.search({'dhash': 'ffffffffffffffff'})['image']['id'] == 'a'
+
+    index.add(make_doc('b', dhash='ffffffffffffffff'))
+    assert index.search({'dhash': 'ffffffffffffffff'})['image']['id'] == 'b'
+
+    index.remove('b')
+    assert index.search({'dhash': 'ffffffffffffffff'}) == {'image': index.records[0], 'distance': 64, 'algorithm': 'dhash'}
+
+
+def test_created_at_is_cached_at_mongodb_precision():
+    index = HashIndex()
+    doc = make_doc('a', dhash='0000000000000000')
+    doc['created_at'] = datetime(2024, 5, 1, 12, 0, 15, 364441)
+    index.add(doc)
+
+    assert index.find_exact('sha-a')['image']['created_at'] == datetime(2024, 5, 1, 12, 0, 15, 364000)
+
+
+class FakeCursor:
+    def __init__(self, docs, on_read=None):
+        self.docs, self.on_read = docs, on_read
+
+    async def __aiter__(self):
+        if self.on_read:
+            self.on_read()
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    """Serves the given results in turn from image_links.find(); exceptions are raised"""
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def find(self, *args, **kwargs):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@pytest.fixture
+def fresh_index(monkeypatch):
+    index = HashIndex()
+    monkeypatch.setattr(server, 'hash_index', index)
+    monkeypatch.setattr(server, 'hash_index_lock', asyncio.Lock())
+    return index
+
+
+def use_collection(monkeypatch, collection):
+    monkeypatch.setattr(server, 'db', SimpleNamespace(image_links=collection))
+
+
+def test_failed_startup_load_is_retried(monkeypatch, fresh_index):
+    stored = make_doc('stored', dhash='0000000000000000')
+    use_collection(monkeypatch, FakeCollection(ConnectionError('mongo down'), FakeCursor([stored])))
+
+    asyncio.run(server.load_hash_index())
+    assert not fresh_index.loaded
+
+    # An image linked during the outage does not count as a loaded index
+    fresh_index.add(make_doc('linked-since-boot', dhash='ffffffffffffffff'))
+    assert not fresh_index.loaded
+
+    asyncio.run(server.ensure_hash_index_loaded())
+
+    assert fresh_index.loaded
+    assert fresh_index.ids == ['stored']
+
+
+def test_reload_rereads_when_the_index_changes_mid_read(monkeypatch, fresh_index):
+    first = make_doc('first', dhash='0000000000000000')
+    second = make_doc('second', dhash='ffffffffffffffff')
+    use_collection(monkeypatch, FakeCollection(
+        FakeCursor([first], on_read=lambda: fresh_index.add(second)),
+        FakeCursor([first, second]),
+    ))
+
+    asyncio.run(server.ensure_hash_index_loaded())
+
+    assert fresh_index.ids == ['first', 'second']
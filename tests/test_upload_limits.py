@@ -0,0 +1,123 @@
+"""
+Unit tests for the UploadSizeLimit middleware guarding the upload endpoints
+"""
+
+import asyncio
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'backend'))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'test_database')
+
+import server  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+BOUNDARY = b'test-boundary'
+
+
+def multipart_chunks(file_size):
+    """Yield a multipart upload of file_size bytes in CHUNK_SIZE pieces"""
+    yield (
+        b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="url"\r\n\r\nhttps://example.com\r\n'
+        b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="big.bmp"\r\n'
+        b'Content-Type: image/bmp\r\n\r\n'
+    )
+    for _ in range(file_size // CHUNK_SIZE):
+        yield b'x' * CHUNK_SIZE
+    yield b'\r\n--' + BOUNDARY + b'--\r\n'
+
+
+def post(path, chunks, content_length=None):
+    """Drive the ASGI app with a streamed POST and return (status, body bytes the app pulled)"""
+    headers = [(b'content-type', b'multipart/form-data; boundary=' + BOUNDARY)]
+    if content_length is not None:
+        headers.append((b'content-length', str(content_length).encode()))
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': headers, 'client': ('127.0.0.1', 1234), 'server': ('127.0.0.1', 8001),
+    }
+    chunks = iter(chunks)
+    pulled = 0
+    messages = []
+
+    async def receive():
+        nonlocal pulled
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        pulled += len(chunk)
+        return {'type': 'http.request', 'body': chunk, 'more_body': True}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(server.app(scope, receive, send))
+    return messages[0]['status'], pulled
+
+
+@pytest.mark.parametrize('path', ['/api/link-image', '/api/scan-image'])
+def test_chunked_upload_stops_at_the_cap(path):
+    limit = server.image_processor.max_file_size + server.MULTIPART_OVERHEAD
+
+    status, pulled = post(path, multipart_chunks(30 * 1024 * 1024))
+
+    assert status == 413
+    assert pulled <= limit + CHUNK_SIZE
+
+
+def test_declared_oversized_upload_is_rejected_unread():
+    status, pulled = post('/api/link-image', multipart_chunks(30 * 1024 * 1024), content_length=30 * 1024 * 1024)
+
+    assert status == 413
+    assert pulled == 0
+
+
+def test_chunked_upload_under_the_cap_reaches_the_handler(monkeypatch):
+    index = server.HashIndex()
+    index.load([])
+    monkeypatch.setattr(server, 'hash_index', index)
+    monkeypatch.setattr(server, 'hash_index_lock', asyncio.Lock())
+    image = io.BytesIO()
+    Image.new('RGB', (50, 50), (1, 2, 250)).save(image, format='BMP')
+    chunks = [
+        b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="small.bmp"\r\n'
+        b'Content-Type: image/bmp\r\n\r\n',
+        image.getvalue(),
+        b'\r\n--' + BOUNDARY + b'--\r\n',
+    ]
+
+    status, pulled = post('/api/scan-image', chunks)
+
+    assert status == 200
+    assert pulled == sum(len(chunk) for chunk in chunks)
+
+
+def test_bulk_upload_budget_covers_every_file():
+    budget = server.MAX_BULK_FILES * (server.image_processor.max_file_size + server.MULTIPART_OVERHEAD)
+
+    status, pulled = post('/api/link-images-bulk', multipart_chunks(0), content_length=budget + 1)
+
+    assert status == 413
+    assert pulled == 0
+
+
+def test_bulk_upload_rejects_too_many_files():
+    parts = []
+    for position in range(server.MAX_BULK_FILES + 1):
+        parts.append(
+            b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="urls"\r\n\r\nhttps://example.com\r\n'
+            b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="files"; filename="'
+            + str(position).encode() + b'.bmp"\r\nContent-Type: image/bmp\r\n\r\nnot decoded\r\n'
+        )
+    parts.append(b'--' + BOUNDARY + b'--\r\n')
+
+    status, _ = post('/api/link-images-bulk', parts)
+
+    assert status == 413